@@ -0,0 +1,37 @@
+# cython: boundscheck=False, wraparound=False, cdivision=True, language_level=3
+"""
+Native haversine kernel for the /nearby batch path.
+
+Optional: build with `python setup.py build_ext --inplace`; main.py falls back to
+NumPy when this module isn't compiled.
+"""
+from libc.math cimport asin, cos, sin, sqrt
+
+cdef double DEG = 0.017453292519943295
+cdef double EARTH_DIAMETER_KM = 12742.0
+
+
+cdef inline double _hav_fixed(double lat1_rad, double cos_lat1, double lon1_rad,
+                              double lat2, double lon2) noexcept nogil:
+    # haversine (km) from a fixed center whose radian/cosine terms are precomputed
+    cdef double s1 = sin((lat2 * DEG - lat1_rad) * 0.5)
+    cdef double s2 = sin((lon2 * DEG - lon1_rad) * 0.5)
+    cdef double a = s1 * s1 + cos_lat1 * cos(lat2 * DEG) * s2 * s2
+    # rounding can push a just past 1 for antipodal points (NaN stays NaN)
+    if a > 1.0:
+        a = 1.0
+    return EARTH_DIAMETER_KM * asin(sqrt(a))
+
+
+cpdef void hav_batch(double lat0, double lon0, const double[::1] lats, const double[::1] lons,
+                     double[::1] out):
+    """Write the distance in km from (lat0, lon0) to each (lats[i], lons[i]) into out[i]."""
+    cdef Py_ssize_t i, n = lats.shape[0]
+    if lons.shape[0] != n or out.shape[0] != n:
+        raise ValueError("lats, lons and out must have the same length")
+    cdef double lat0_rad = lat0 * DEG
+    cdef double cos_lat0 = cos(lat0_rad)
+    cdef double lon0_rad = lon0 * DEG
+    with nogil:
+        for i in range(n):
+            out[i] = _hav_fixed(lat0_rad, cos_lat0, lon0_rad, lats[i], lons[i])
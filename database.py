@@ -5,8 +5,8 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
-from datetime import datetime, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
 import os
 from dotenv import load_dotenv
 from typing import Union
@@ -22,12 +22,12 @@ database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    _client = AsyncIOMotorClient(database_url)
     db = _client[database_name]
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
-    """Insert a single document with timestamp"""
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
+    """Insert a single document with server-side timestamps"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
 
@@ -37,19 +37,32 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     else:
         data_dict = data.copy()
 
-    data_dict['created_at'] = datetime.now(timezone.utc)
-    data_dict['updated_at'] = datetime.now(timezone.utc)
+    # Timestamps come from the database clock via $currentDate; an upsert on a fresh
+    # ObjectId inserts exactly one new document
+    data_dict.pop('created_at', None)
+    data_dict.pop('updated_at', None)
+    doc_id = data_dict.pop('_id', None) or ObjectId()
+    update = {'$currentDate': {'created_at': True, 'updated_at': True}}
+    if data_dict:
+        update['$set'] = data_dict
 
-    result = db[collection_name].insert_one(data_dict)
-    return str(result.inserted_id)
+    await db[collection_name].update_one({'_id': doc_id}, update, upsert=True)
+    return str(doc_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
+async def iter_documents(collection_name: str, filter_dict: dict = None, projection: dict = None, sort: list = None, limit: int = None):
+    """Stream documents from collection, optionally projected and sorted"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
-    
-    cursor = db[collection_name].find(filter_dict or {})
+
+    cursor = db[collection_name].find(filter_dict or {}, projection).batch_size(100)
+    if sort:
+        cursor = cursor.sort(sort)
     if limit:
         cursor = cursor.limit(limit)
-    
-    return list(cursor)
+
+    async for doc in cursor:
+        yield doc
+
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
+    """Get documents from collection"""
+    return [doc async for doc in iter_documents(collection_name, filter_dict, limit=limit)]
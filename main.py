@@ -1,18 +1,42 @@
+import asyncio
+import logging
 import os
+from datetime import datetime
 from typing import List, Optional
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from math import radians, sin, cos, asin, sqrt
-
-from database import db, create_document, get_documents
-from schemas import Team, Matchpost, Message
-
-app = FastAPI(title="FindRivals API")
+from fastapi.responses import ORJSONResponse
+from pydantic import AliasChoices, BaseModel, Field, field_validator
+from math import sin, cos, asin
+
+from bson import ObjectId
+from cachetools import TTLCache
+import numpy as np
+from pymongo.collection import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+try:
+    # optional native kernel, see setup.py
+    from _hav import hav_batch
+except ImportError:
+    hav_batch = None
+
+from database import db, create_document, iter_documents
+from schemas import Sport, Team, Matchpost, Message
+
+app = FastAPI(title="FindRivals API", default_response_class=ORJSONResponse)
+logger = logging.getLogger(__name__)
+
+# "*" is not valid alongside credentials, so frontends are listed explicitly: exact origins
+# from CORS_ORIGINS (comma-separated, checked by set lookup) plus one precompiled regex,
+# which by default admits local dev servers on any port. See README "Configuration".
+CORS_ORIGINS = frozenset(o.strip() for o in os.getenv("CORS_ORIGINS", "").split(",") if o.strip())
+CORS_ORIGIN_REGEX = os.getenv("CORS_ORIGIN_REGEX", r"^https?://(localhost|127\.0\.0\.1)(:\d+)?$")
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=CORS_ORIGINS,
+    allow_origin_regex=CORS_ORIGIN_REGEX,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -31,37 +55,278 @@ SPORT_PREFIX = {
 }
 
 
-def generate_team_id(sport: str) -> str:
+class DocumentOut(BaseModel):
+    # Response base: exposes Mongo's ObjectId `_id` as a string `id` during validation,
+    # so handlers can return raw documents without rewriting each one
+    id: str = Field(validation_alias=AliasChoices("_id", "id"))
+
+    @field_validator("id", mode="before")
+    @classmethod
+    def _coerce_id(cls, value):
+        return str(value)
+
+
+# Newest-first order for paged lists; _id breaks ties between equal (millisecond) timestamps
+NEWEST_FIRST = [("created_at", -1), ("_id", -1)]
+
+
+def keyset_before(before: Optional[datetime], before_id: Optional[str]) -> dict:
+    # Filter for the page after (before, before_id), the created_at and id of the last item
+    # already shown. Items sharing that timestamp continue in _id order instead of being skipped.
+    if before is None and before_id is None:
+        return {}
+    if before is None or before_id is None or not ObjectId.is_valid(before_id):
+        raise HTTPException(status_code=400, detail="Pass both before (created_at) and before_id (id) of the last item shown")
+    return {"$or": [
+        {"created_at": {"$lt": before}},
+        {"created_at": before, "_id": {"$lt": ObjectId(before_id)}},
+    ]}
+
+
+async def generate_team_id(sport: str) -> str:
     prefix = SPORT_PREFIX.get(sport, "TMP")
-    # Use count of existing teams for this sport + incremental suffix
+    # Atomic per-sport counter: one indexed write, and concurrent registrations never share an ID.
+    # Errors propagate: guessing a suffix would hand out an ID that is already taken.
+    counter = await db["counters"].find_one_and_update(
+        {"_id": sport},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    suffix = 100 + counter["seq"] - 1
+    return f"{prefix}-{suffix}"
+
+
+# Process-local cache of the team fields the hot paths read; teams rarely change after registration
+TEAM_CACHE_FIELDS = {
+    "_id": 0,
+    "team_id": 1,
+    "team_name": 1,
+    "location_name": 1,
+    "latitude": 1,
+    "longitude": 1,
+    "contact_number": 1,
+    "contact_methods": 1,
+}
+_team_cache = TTLCache(maxsize=10_000, ttl=30)
+
+
+async def get_teams_cached(team_ids: List[str]) -> dict:
+    # Map of team_id -> cached team fields; unknown IDs are simply absent (and not cached)
+    found = {}
+    for team_id in team_ids:
+        team = _team_cache.get(team_id)
+        if team is not None:
+            found[team_id] = team
+    missing = [team_id for team_id in set(team_ids) if team_id not in found]
+    if missing:
+        async for team in db["team"].find({"team_id": {"$in": missing}}, TEAM_CACHE_FIELDS):
+            found[team["team_id"]] = team
+            _team_cache[team["team_id"]] = team
+    return found
+
+
+async def get_team_cached(team_id: str) -> Optional[dict]:
+    return (await get_teams_cached([team_id])).get(team_id)
+
+
+# Degree-to-radian factors (full and halved) and Earth's mean radius/diameter in km
+DEG = 0.017453292519943295
+EARTH_RADIUS_KM = 6371.0
+EARTH_DIAMETER_KM = 12742.0
+
+
+def _hav_fixed(lat1_rad: float, cos_lat1: float, lon1_rad: float, lat2, lon2):
+    # haversine (km) from a fixed center whose radian/cosine terms are computed once by the caller
+    s1 = np.sin((lat2 * DEG - lat1_rad) * 0.5)
+    s2 = np.sin((lon2 * DEG - lon1_rad) * 0.5)
+    a = s1 * s1 + cos_lat1 * np.cos(lat2 * DEG) * s2 * s2
+    return EARTH_DIAMETER_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_vec(lat0: float, lon0: float, lats, lons) -> np.ndarray:
+    # distances in km from (lat0, lon0) to every point; NaN where a coordinate is missing
+    lats = np.ascontiguousarray(lats, dtype=np.float64)
+    lons = np.ascontiguousarray(lons, dtype=np.float64)
+    if hav_batch is not None:
+        out = np.empty_like(lats)
+        hav_batch(lat0, lon0, lats, lons, out)
+        return out
+    lat0_rad = lat0 * DEG
+    return _hav_fixed(lat0_rad, cos(lat0_rad), lon0 * DEG, lats, lons)
+
+
+# Coordinates are also stored as int32 fixed-point microdegrees (lat_u/lon_u) so the batch
+# pre-filter compares 4-byte integers instead of doubles; 1e6 keeps every difference in int32.
+COORD_SCALE = 1_000_000
+_NO_COORD = np.iinfo(np.int32).min
+
+
+def quantize(value: Optional[float]) -> Optional[int]:
+    return None if value is None else int(round(value * COORD_SCALE))
+
+
+def bounding_box_mask(center_lat: float, center_lon: float, range_km: float, lats_u, lons_u) -> np.ndarray:
+    # Cheap pre-filter over fixed-point coordinates: True for points inside the lat/lon box
+    # that encloses the search circle. The longitude half-width is the exact one for a
+    # spherical cap (asin(sin d / cos lat)), which is wider than range/cos(lat) away from
+    # the equator, so no in-range team is pruned; +1 absorbs rounding to the grid.
+    delta = range_km / EARTH_RADIUS_KM
+    mask = (lats_u != _NO_COORD) & (lons_u != _NO_COORD)
+    dlat_u = np.int32(delta / DEG * COORD_SCALE + 1)
+    mask &= np.abs(lats_u - np.int32(quantize(center_lat))) <= dlat_u
+    sin_ratio = sin(delta) / cos(center_lat * DEG)
+    if sin_ratio < 1.0:  # otherwise the circle covers a pole and every longitude qualifies
+        dlon_u = np.abs(lons_u - np.int32(quantize(center_lon)))
+        dlon_u = np.minimum(dlon_u, np.int32(360 * COORD_SCALE) - dlon_u)  # across the antimeridian
+        mask &= dlon_u <= np.int32(asin(sin_ratio) / DEG * COORD_SCALE + 1)
+    return mask
+
+
+def _as_float(value) -> float:
     try:
-        count = db["team"].count_documents({"sport": sport}) if db else 0
+        return float(value) if value is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _fixed_point(team: dict, key: str, float_key: str, limit: int) -> int:
+    # limit is 90 for latitude, 180 for longitude; anything outside it (or missing) has no
+    # usable coordinate and must not reach the int32 array
+    value = team.get(key)
+    if isinstance(value, int):
+        return value if abs(value) <= limit * COORD_SCALE else _NO_COORD
+    # teams stored before lat_u/lon_u existed (and not yet backfilled)
+    value = _as_float(team.get(float_key))
+    return quantize(value) if abs(value) <= limit else _NO_COORD
+
+
+def geo_point(lat: Optional[float], lon: Optional[float]) -> Optional[dict]:
+    # GeoJSON point for the 2dsphere index (note: longitude first)
+    if lat is None or lon is None:
+        return None
+    return {"type": "Point", "coordinates": [lon, lat]}
+
+
+# Legacy teams may hold out-of-range coordinates; those are treated as "no coordinates"
+VALID_COORDS = {"latitude": {"$gte": -90, "$lte": 90}, "longitude": {"$gte": -180, "$lte": 180}}
+
+
+async def _ensure_geo_index():
+    # Backfill GeoJSON locations for teams registered before the geo index existed
+    await db["team"].update_many(
+        {"location": None, **VALID_COORDS},
+        [{"$set": {"location": {"type": "Point", "coordinates": ["$longitude", "$latitude"]}}}],
+    )
+    await db["team"].create_index([("location", "2dsphere")])
+    # 2dsphere indexes skip teams without a location, so /nearby's "no coordinates" lookup
+    # ({"location": null}, optionally by sport) needs its own B-tree index to avoid a scan
+    await db["team"].create_index([("location", 1), ("sport", 1)])
+
+
+async def _backfill_fixed_point_coords():
+    # Same rounding as quantize() (both round half to even)
+    def fixed(field):
+        return {"$toInt": {"$round": [{"$multiply": [field, COORD_SCALE]}, 0]}}
+
+    await db["team"].update_many(
+        {"lat_u": None, **VALID_COORDS},
+        [{"$set": {"lat_u": fixed("$latitude"), "lon_u": fixed("$longitude")}}],
+    )
+
+
+async def _seed_team_counters():
+    # Start team ID counters past existing teams so new IDs don't collide with old ones
+    for sport in SPORT_PREFIX:
+        count = await db["team"].count_documents({"sport": sport})
+        await db["counters"].update_one({"_id": sport}, {"$max": {"seq": count}}, upsert=True)
+
+
+async def _backfill_conversation_keys():
+    # Same key as conversation_key(), computed server-side for messages stored before it existed
+    await db["message"].update_many(
+        {"conv_key": {"$exists": False}},
+        [{"$set": {"conv_key": {"$cond": [
+            {"$lte": ["$from_team_id", "$to_team_id"]},
+            {"$concat": ["$from_team_id", "-", "$to_team_id"]},
+            {"$concat": ["$to_team_id", "-", "$from_team_id"]},
+        ]}}}],
+    )
+
+
+async def _ensure_query_indexes():
+    await db["team"].create_index([("sport", 1)])
+    await db["matchpost"].create_index([("sport", 1), ("created_at", -1), ("_id", -1)])
+    await db["matchpost"].create_index([("created_at", -1), ("_id", -1)])
+    await db["message"].create_index([("conv_key", 1), ("created_at", 1), ("_id", 1)])
+    # Last: fails if older data already holds duplicate team IDs
+    await db["team"].create_index([("team_id", 1)], unique=True)
+
+
+# Set once the unique players index is confirmed; until then register_team checks players itself
+_player_index_ready = False
+
+
+async def _ensure_player_index():
+    # A player belongs to at most one team. $ne isn't allowed in partial filters, so
+    # "players.0 exists" keeps teams with no players out of the unique index.
+    global _player_index_ready
+    try:
+        name = await db["team"].create_index(
+            [("players", 1)],
+            unique=True,
+            partialFilterExpression={"players.0": {"$exists": True}},
+        )
     except Exception:
-        count = 0
-    suffix = 100 + count
-    return f"{prefix}-{suffix}"
+        logger.exception(
+            "Unique players index could not be built (existing teams may share players); "
+            "registration keeps checking players before insert"
+        )
+        return
+    info = (await db["team"].index_information()).get(name, {})
+    _player_index_ready = bool(info.get("unique")) and info.get("key") == [("players", 1)]
 
 
-def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    # distance in km
-    R = 6371.0
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
-    c = 2 * asin(sqrt(a))
-    return R * c
+async def _maintain_database():
+    try:
+        await db.command("ping")
+    except Exception:
+        logger.exception("Database unreachable at startup; skipping index builds and backfills")
+        return
+    for step in (
+        _seed_team_counters,
+        _ensure_player_index,
+        _ensure_query_indexes,
+        _backfill_conversation_keys,
+        _ensure_geo_index,
+        _backfill_fixed_point_coords,
+    ):
+        try:
+            await step()
+        except Exception:
+            # e.g. existing data an index can't cover; the remaining steps still run
+            logger.exception("Startup database step %s failed", step.__name__)
+
+
+@app.on_event("startup")
+async def prepare_database():
+    # Index builds and backfills run in the background so the API serves requests right away,
+    # even when the database is slow or unreachable at boot
+    if db is None:
+        return
+    app.state.db_maintenance = asyncio.create_task(_maintain_database())
 
 
 # ---------------------------
 # Basic
 # ---------------------------
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "FindRivals API running"}
 
 
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -77,7 +342,7 @@ def test_database():
             response["database_name"] = getattr(db, "name", "Unknown")
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
+                collections = await db.list_collection_names()
                 response["collections"] = collections[:10]
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
@@ -94,29 +359,45 @@ def test_database():
 # ---------------------------
 class TeamCreate(BaseModel):
     team_name: str
-    sport: str
+    sport: Sport
     players: List[str] = []
     location_name: Optional[str] = None
     # Coordinates are optional and set via "Use my location"; UI doesn't ask to type them
-    latitude: Optional[float] = None
-    longitude: Optional[float] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
     contact_methods: List[str] = []  # e.g., ["call", "text"]
     contact_number: str
     availability: List[str] = []
 
 
+class TeamOut(DocumentOut):
+    team_id: str
+    team_name: Optional[str] = None
+    sport: Optional[str] = None
+    players: Optional[List[str]] = None
+    location_name: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    contact_methods: Optional[List[str]] = None
+    contact_number: Optional[str] = None
+    availability: Optional[List[str]] = None
+    distance_km: Optional[float] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
 @app.post("/teams", response_model=dict)
-def register_team(payload: TeamCreate):
+async def register_team(payload: TeamCreate):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available. Please try again later.")
 
-    # Ensure players unique across teams (soft check by name)
-    if payload.players:
-        existing = db["team"].find_one({"players": {"$in": payload.players}})
+    if payload.players and not _player_index_ready:
+        # Fallback until the unique players index exists (see _ensure_player_index)
+        existing = await db["team"].find_one({"players": {"$in": payload.players}}, {"_id": 1})
         if existing:
             raise HTTPException(status_code=400, detail="One or more players already belong to another team")
 
-    team_id = generate_team_id(payload.sport)
+    team_id = await generate_team_id(payload.sport)
     team = Team(
         team_name=payload.team_name,
         sport=payload.sport,
@@ -128,31 +409,36 @@ def register_team(payload: TeamCreate):
         contact_number=payload.contact_number,
         availability=payload.availability or [],
         team_id=team_id,
+        location=geo_point(payload.latitude, payload.longitude),
+        lat_u=quantize(payload.latitude),
+        lon_u=quantize(payload.longitude),
     )
-    inserted_id = create_document("team", team)
+    # Players are unique across teams (by name), enforced by the unique index on players
+    try:
+        inserted_id = await create_document("team", team)
+    except DuplicateKeyError as e:
+        if "players" not in (e.details or {}).get("keyPattern", {}):
+            raise
+        raise HTTPException(status_code=400, detail="One or more players already belong to another team")
     return {"ok": True, "team_id": team_id, "id": inserted_id}
 
 
-@app.get("/teams", response_model=list)
-def list_teams(sport: Optional[str] = None):
+@app.get("/teams", response_model=List[TeamOut], response_model_exclude_unset=True)
+async def list_teams(sport: Optional[str] = None):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available. Please try again later.")
     q = {"sport": sport} if sport else {}
-    items = get_documents("team", q)
-    # stringify _id for frontend
-    for it in items:
-        it["id"] = str(it.pop("_id", ""))
-    return items
+    # player lists and the GeoJSON point are only needed on the team detail view
+    return [t async for t in iter_documents("team", q, projection={"players": 0, "location": 0})]
 
 
-@app.get("/teams/{team_id}", response_model=dict)
-def get_team(team_id: str):
+@app.get("/teams/{team_id}", response_model=TeamOut, response_model_exclude_unset=True)
+async def get_team(team_id: str):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available. Please try again later.")
-    doc = db["team"].find_one({"team_id": team_id})
+    doc = await db["team"].find_one({"team_id": team_id})
     if not doc:
         raise HTTPException(status_code=404, detail="Team not found")
-    doc["id"] = str(doc.pop("_id", ""))
     return doc
 
 
@@ -167,11 +453,28 @@ class MatchCreate(BaseModel):
     note: Optional[str] = None
 
 
+class MatchpostOut(DocumentOut):
+    team_id: str
+    sport: Optional[str] = None
+    num_players: Optional[int] = None
+    time_pref: Optional[str] = None
+    note: Optional[str] = None
+    location_name: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    # creator details joined in by /feed
+    team_name: Optional[str] = None
+    contact_number: Optional[str] = None
+    contact_methods: Optional[List[str]] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
 @app.post("/matchposts", response_model=dict)
-def create_match_post(payload: MatchCreate):
+async def create_match_post(payload: MatchCreate):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available. Please try again later.")
-    team = db["team"].find_one({"team_id": payload.team_id})
+    team = await get_team_cached(payload.team_id)
     if not team:
         raise HTTPException(status_code=404, detail="Team not found")
     mp = Matchpost(
@@ -184,17 +487,20 @@ def create_match_post(payload: MatchCreate):
         latitude=team.get("latitude"),
         longitude=team.get("longitude"),
     )
-    inserted_id = create_document("matchpost", mp)
+    inserted_id = await create_document("matchpost", mp)
     return {"ok": True, "id": inserted_id}
 
 
-@app.get("/feed", response_model=list)
-def match_feed(
+@app.get("/feed", response_model=List[MatchpostOut], response_model_exclude_unset=True)
+async def match_feed(
     sport: Optional[str] = None,
     time_pref: Optional[str] = None,
     num_players_min: Optional[int] = Query(None, ge=1),
     num_players_max: Optional[int] = Query(None, ge=1),
     note_contains: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[datetime] = None,
+    before_id: Optional[str] = None,
 ):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available. Please try again later.")
@@ -212,104 +518,161 @@ def match_feed(
         q["num_players"] = rng
     if note_contains:
         q["note"] = {"$regex": note_contains, "$options": "i"}
+    # keyset pagination from the last post already shown
+    q.update(keyset_before(before, before_id))
 
     try:
-        items = get_documents("matchpost", q)
+        items = [it async for it in iter_documents("matchpost", q, sort=NEWEST_FIRST, limit=limit)]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)[:80]}")
-    # enrich each post with team details (creator info)
+    # enrich each post with team details (creator info), fetching uncached creators in one query
     if items:
+        teams = await get_teams_cached([it.get("team_id") for it in items])
         for it in items:
-            team = db["team"].find_one({"team_id": it.get("team_id")})
+            team = teams.get(it.get("team_id"))
             if team:
                 it["team_name"] = team.get("team_name")
                 it["contact_number"] = team.get("contact_number")
                 it["contact_methods"] = team.get("contact_methods", [])
-    for it in items:
-        it["id"] = str(it.pop("_id", ""))
-    # sort by created_at desc if present
-    items.sort(key=lambda x: x.get("created_at", ""), reverse=True)
     return items
 
 
 # ---------------------------
 # Nearby Opponents
 # ---------------------------
-@app.get("/nearby", response_model=list)
-def nearby_teams(
+NEARBY_PROJECTION = {
+    "team_name": 1,
+    "sport": 1,
+    "latitude": 1,
+    "longitude": 1,
+    "location_name": 1,
+    "team_id": 1,
+}
+
+
+@app.get("/nearby", response_model=List[TeamOut], response_model_exclude_unset=True)
+async def nearby_teams(
     sport: Optional[str] = None,
-    center_lat: Optional[float] = Query(None),
-    center_lon: Optional[float] = Query(None),
+    center_lat: Optional[float] = Query(None, ge=-90, le=90),
+    center_lon: Optional[float] = Query(None, ge=-180, le=180),
     range_km: float = Query(10, ge=1, le=100),
 ):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available. Please try again later.")
     q = {"sport": sport} if sport else {}
+    if center_lat is not None and center_lon is not None:
+        try:
+            return await _nearby_geo(q, center_lat, center_lon, range_km)
+        except OperationFailure:
+            # No usable 2dsphere index (e.g. it failed to build); filter in-process instead
+            pass
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)[:80]}")
     try:
-        teams = get_documents("team", q)
+        projection = {**NEARBY_PROJECTION, "lat_u": 1, "lon_u": 1}
+        teams = [t async for t in iter_documents("team", q, projection=projection)]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)[:80]}")
-    result = []
-    for t in teams:
-        t["id"] = str(t.pop("_id", ""))
-        lat, lon = t.get("latitude"), t.get("longitude")
-        if center_lat is None or center_lon is None or lat is None or lon is None:
-            # if coordinates not provided, include all
-            result.append(t)
-        else:
-            try:
-                dist = haversine(center_lat, center_lon, lat, lon)
-                if dist <= range_km:
-                    t["distance_km"] = round(dist, 2)
-                    result.append(t)
-            except Exception:
-                result.append(t)
-    # if we computed distances, sort by distance
-    result.sort(key=lambda x: x.get("distance_km", 0))
+    if center_lat is None or center_lon is None or not teams:
+        return teams
+
+    lats_u = np.fromiter((_fixed_point(t, "lat_u", "latitude", 90) for t in teams), np.int32, len(teams))
+    lons_u = np.fromiter((_fixed_point(t, "lon_u", "longitude", 180) for t in teams), np.int32, len(teams))
+    # teams without (usable) coordinates are always included, ahead of the rest
+    result = [teams[i] for i in np.flatnonzero((lats_u == _NO_COORD) | (lons_u == _NO_COORD))]
+    idx = np.flatnonzero(bounding_box_mask(center_lat, center_lon, range_km, lats_u, lons_u))
+    # only the survivors go back to float64 for the exact distance
+    dist = haversine_vec(center_lat, center_lon, lats_u[idx] / COORD_SCALE, lons_u[idx] / COORD_SCALE)
+    within = dist <= range_km
+    idx, dist = idx[within], dist[within].round(2)
+    order = np.argsort(dist, kind="stable")
+    for i, d in zip(idx[order], dist[order]):
+        t = teams[i]
+        t["distance_km"] = float(d)
+        result.append(t)
+    return result
+
+
+async def _nearby_geo(q: dict, center_lat: float, center_lon: float, range_km: float) -> list:
+    # Teams without coordinates are always included, ahead of the distance-sorted ones
+    result = [t async for t in iter_documents("team", {**q, "location": None}, projection=NEARBY_PROJECTION)]
+    pipeline = [
+        {"$geoNear": {
+            "near": geo_point(center_lat, center_lon),
+            "key": "location",
+            "distanceField": "distance_m",
+            "maxDistance": range_km * 1000,
+            "spherical": True,
+            "query": q,
+        }},
+        {"$project": {**NEARBY_PROJECTION, "distance_km": {"$round": [{"$divide": ["$distance_m", 1000]}, 2]}}},
+    ]
+    result.extend(await db["team"].aggregate(pipeline).to_list(length=None))
     return result
 
 
 # ---------------------------
 # Simple Chat
 # ---------------------------
+def conversation_key(team_a: str, team_b: str) -> str:
+    # Order-independent, so both directions of a chat share one indexed key
+    return "-".join(sorted([team_a, team_b]))
+
+
 class ChatCreate(BaseModel):
     from_team_id: str
     to_team_id: str
     text: str
 
 
+class MessageOut(DocumentOut):
+    from_team_id: str
+    to_team_id: str
+    text: str
+    conv_key: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
 @app.post("/chat", response_model=dict)
-def send_message(payload: ChatCreate):
+async def send_message(payload: ChatCreate):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available. Please try again later.")
-    # Ensure both teams exist
-    a = db["team"].find_one({"team_id": payload.from_team_id})
-    b = db["team"].find_one({"team_id": payload.to_team_id})
+    # Ensure both teams exist, in at most one round-trip
+    teams = await get_teams_cached([payload.from_team_id, payload.to_team_id])
+    a, b = teams.get(payload.from_team_id), teams.get(payload.to_team_id)
     if not a or not b:
         raise HTTPException(status_code=404, detail="Team not found")
     # Basic registration check: both must have contact number
     if not a.get("contact_number") or not b.get("contact_number"):
         raise HTTPException(status_code=400, detail="Teams must complete registration to chat")
 
-    m = Message(from_team_id=payload.from_team_id, to_team_id=payload.to_team_id, text=payload.text)
-    inserted_id = create_document("message", m)
+    m = Message(
+        from_team_id=payload.from_team_id,
+        to_team_id=payload.to_team_id,
+        text=payload.text,
+        conv_key=conversation_key(payload.from_team_id, payload.to_team_id),
+    )
+    inserted_id = await create_document("message", m)
     return {"ok": True, "id": inserted_id}
 
 
-@app.get("/chat/{team_a}/{team_b}", response_model=list)
-def get_conversation(team_a: str, team_b: str):
+@app.get("/chat/{team_a}/{team_b}", response_model=List[MessageOut], response_model_exclude_unset=True)
+async def get_conversation(
+    team_a: str,
+    team_b: str,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[datetime] = None,
+    before_id: Optional[str] = None,
+):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available. Please try again later.")
-    msgs = get_documents(
-        "message",
-        {"$or": [
-            {"from_team_id": team_a, "to_team_id": team_b},
-            {"from_team_id": team_b, "to_team_id": team_a},
-        ]},
-    )
-    for m in msgs:
-        m["id"] = str(m.pop("_id", ""))
-    msgs.sort(key=lambda x: x.get("created_at", ""))
+    q: dict = {"conv_key": conversation_key(team_a, team_b)}
+    # keyset pagination from the oldest message already shown
+    q.update(keyset_before(before, before_id))
+    # newest page first from the index, returned oldest-to-newest for display
+    msgs = [m async for m in iter_documents("message", q, sort=NEWEST_FIRST, limit=limit)]
+    msgs.reverse()
     return msgs
 
 
@@ -317,17 +680,23 @@ def get_conversation(team_a: str, team_b: str):
 # Admin Basics
 # ---------------------------
 @app.get("/admin/stats", response_model=dict)
-def admin_stats():
-    teams = db["team"].count_documents({}) if db else 0
-    posts = db["matchpost"].count_documents({}) if db else 0
+async def admin_stats():
+    if db is None:
+        return {"total_teams": 0, "total_match_posts": 0}
+    # Collection metadata counts: O(1) each, issued concurrently
+    teams, posts = await asyncio.gather(
+        db["team"].estimated_document_count(),
+        db["matchpost"].estimated_document_count(),
+    )
     return {"total_teams": teams, "total_match_posts": posts}
 
 
 @app.delete("/admin/teams/{team_id}", response_model=dict)
-def admin_delete_team(team_id: str):
+async def admin_delete_team(team_id: str):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not available. Please try again later.")
-    res = db["team"].delete_one({"team_id": team_id})
+    res = await db["team"].delete_one({"team_id": team_id})
+    _team_cache.pop(team_id, None)
     return {"deleted": res.deleted_count == 1}
 
 
@@ -4,7 +4,7 @@ Database Schemas for FindRivals
 Each Pydantic model represents a collection in MongoDB. The collection name
 is the lowercase of the class name.
 """
-from typing import List, Optional, Literal
+from typing import Any, Dict, List, Optional, Literal
 from pydantic import BaseModel, Field
 
 # ---------------------------
@@ -26,6 +26,9 @@ class Team(BaseModel):
     contact_number: str = Field(..., description="Phone number")
     availability: List[TimeSlot] = Field(default_factory=list, description="Available times of day")
     team_id: str = Field(..., description="Auto-generated team identifier like CRK-129")
+    location: Optional[Dict[str, Any]] = Field(None, description="GeoJSON point backing the 2dsphere index")
+    lat_u: Optional[int] = Field(None, description="Latitude in int32 fixed-point microdegrees")
+    lon_u: Optional[int] = Field(None, description="Longitude in int32 fixed-point microdegrees")
 
 
 class Matchpost(BaseModel):
@@ -43,3 +46,4 @@ class Message(BaseModel):
     from_team_id: str = Field(...)
     to_team_id: str = Field(...)
     text: str = Field(..., min_length=1, max_length=2000)
+    conv_key: str = Field(..., description="Sorted pair of team IDs shared by both directions of a chat")
@@ -0,0 +1,18 @@
+"""
+Build the optional native haversine kernel (_hav) used by /nearby:
+
+    pip install cython
+    python setup.py build_ext --inplace
+
+The API runs without it; main.py falls back to the NumPy implementation.
+"""
+from Cython.Build import cythonize
+from setuptools import Extension, setup
+
+setup(
+    name="findrivals-hav",
+    ext_modules=cythonize(
+        [Extension("_hav", ["_hav.pyx"], extra_compile_args=["-O3"])],
+        language_level=3,
+    ),
+)
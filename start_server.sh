@@ -12,6 +12,11 @@ if [ ! -z "$PIDS" ]; then
 fi
 
 mkdir -p logs
+# Hosted frontends must be listed in CORS_ORIGINS (comma-separated), here or in .env;
+# only localhost origins are allowed by default (override with CORS_ORIGIN_REGEX). See README.
+if [ -z "$CORS_ORIGINS" ] && ! grep -qs '^CORS_ORIGINS=' .env; then
+  echo "Warning: CORS_ORIGINS is not set; browsers will block hosted frontends (only localhost is allowed)"
+fi
 echo "Installing dependencies..."
 pip install -r requirements.txt
 echo "Starting FastAPI server..."